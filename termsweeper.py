@@ -3,9 +3,12 @@ from textual.containers import Grid, HorizontalGroup
 from textual.widgets import Button, Static, Footer, Digits
 from textual.events import MouseEvent
 from textual.message import Message
+from textual.reactive import var
 from textual import on
+from textual.content import Content
 from typing import NamedTuple
 from enum import Enum
+from collections import deque
 import random
 
 # standard minesweeper constants
@@ -13,6 +16,32 @@ GRID_WIDTH = 16 # 9 16 30
 GRID_HEIGHT = 16 # 9 16 16
 MINES_AMOUNT = 40 # 10 40 99
 
+# (row, col) offsets of the 8 cells surrounding any cell
+NEIGHBORS = ((-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1))
+# (row, col) offset for each direction the cell focus can be moved in
+_MOVES = {"left": (0,-1), "right": (0,1), "up": (-1,0), "down": (1,0)}
+
+def cascade(start: int, adj: list[list[int]], counts: list[int], explored: bytearray) -> list[int]:
+    """Breadth-first flood fill from flat cell index start, through cells with no neighbouring mines.
+       Marks the cells it reaches in explored and returns their indices, without touching any widgets.
+       Iterative so that large empty regions don't build up a deep call stack."""
+    # cells are marked explored as they're queued, so each one is queued at most once
+    explored[start] = 1
+    queue = deque([start])
+    pop = queue.popleft
+    push = queue.append
+    opened = []
+    while queue:
+        idx = pop()
+        opened.append(idx)
+        if counts[idx] == 0:
+            # open all adjacent cells if the mine count is 0 (all adjacent cells are safe)
+            for nidx in adj[idx]:
+                if not explored[nidx]:
+                    explored[nidx] = 1
+                    push(nidx)
+    return opened
+
 class Position(NamedTuple):
     row: int
     col: int
@@ -34,33 +63,46 @@ class MineButton(Button):
     CHAR_MINE = "✷"
     NUMBER_COLORS = ["black", "blue", "green", "red", "darkblue", "darkred", "darkcyan", "white", "grey", "deeppink"]
 
+    # labels with their colour already applied, built once so opening a cell doesn't touch the button's styles.
+    # Button converts any label that isn't already Content (parsing str labels as markup) on every assignment,
+    # so every label the cells use is kept as ready-made Content
+    _NUMBER_LABELS = [Content.styled(str(i), color) for i, color in enumerate(NUMBER_COLORS[:9])]
+    _MINE_LABEL = Content.styled(CHAR_MINE, NUMBER_COLORS[9])
+    _FLAGGED_LABEL = Content(CHAR_FLAGGED)
+    _UNOPENED_LABEL = Content(CHAR_UNOPENED)
+    _EMPTY_LABEL = Content(CHAR_EMPTY)
+
+    # override button default sizings to make a grid. Borders are removed by creating the buttons as compact.
+    # The base colour goes on a "cell" class so that it outranks the colour Button sets for its default variant
+    DEFAULT_CSS = """
+    MineButton {
+        min-width: 3;
+        width: 3;
+        height: 1;
+    }
+    MineButton.cell { color: white; }
+    """
+
     def __init__(self, position: Position, label = None, variant = "default", *, name = None, id = None, 
                  classes = None, disabled = False, tooltip = None, action = None):
         super().__init__(label, variant, name=name, id=id, classes=classes, disabled=disabled, tooltip=tooltip, 
-                         action=action)
+                         action=action, compact=True)
+        self.add_class("cell")
         
         self.position = position
+        # flat index of this cell, so grid logic doesn't need to go through the Position tuple
+        self.index = position.row*GRID_WIDTH + position.col
         self.reset()
 
-        #override button default sizings to make a grid
-        self.styles.min_width=3
-        self.styles.min_height=1
-        self.styles.width= 3
-        self.styles.height= 1
-        self.styles.border_top = ("hidden", "white")
-        self.styles.border_bottom = ("hidden", "white") 
-
     def toggle_flagged(self):
         self.flagged = not self.flagged
-        self.label = self.CHAR_FLAGGED if self.flagged else self.CHAR_UNOPENED
+        self.label = self._FLAGGED_LABEL if self.flagged else self._UNOPENED_LABEL
 
     def set_number(self, value:int):
-        self.label = str(value)
-        self.styles.color = self.NUMBER_COLORS[value]
+        self.label = self._NUMBER_LABELS[value]
 
     def explode(self):
-        self.label = self.CHAR_MINE
-        self.styles.color  = "deeppink"
+        self.label = self._MINE_LABEL
 
     class Selected(Message):
         def __init__(self, button, action: SelectAction):
@@ -69,11 +111,18 @@ class MineButton(Button):
             super().__init__()
 
     def on_click(self, event: MouseEvent):
+        # always posted, even when the action itself does nothing, as the grid also moves the current cell here
         self.post_message(self.Selected(self, SelectAction.OPEN if event.button==1 else SelectAction.FLAG))
 
+    # the key actions apply to the current cell, so no-op inputs (flagging an explored cell, opening a flagged one)
+    # can be dropped here without posting a message
     def action_flag_selected(self):
+        if self.explored:
+            return
         self.post_message(self.Selected(self, SelectAction.FLAG))
     def action_open_selected(self):
+        if self.flagged:
+            return
         self.post_message(self.Selected(self, SelectAction.OPEN))
 
     def reset(self):
@@ -82,9 +131,7 @@ class MineButton(Button):
         self.explored = False
         self.flagged = False
         self.can_focus = False
-        self.label = self.CHAR_UNOPENED
-        self.styles.color= "white"
-        self.mines_flagged = 0
+        self.label = self._UNOPENED_LABEL
 
 class MineGrid(Static):
     BINDINGS = [
@@ -93,32 +140,64 @@ class MineGrid(Static):
         ("down,s", "move_cell_focus('down')", " "),
         ("right,d", "move_cell_focus('right')", " "),
     ]
-    
-    total_explored = 0
-    mines_flagged = 0
-    _current_cell = Position(0,0)
-    buttons = [[MineButton(Position(row,col)) for col in range(GRID_WIDTH)]for row in range(GRID_HEIGHT)]
 
     def __init__(self, content = "", *, expand = False, shrink = False, markup = True, name = None, id = None, 
                  classes = None, disabled = False):
         super().__init__(content, expand=expand, shrink=shrink, markup=markup, name=name, id=id, classes=classes, 
                          disabled=disabled)
+        self.total_explored = 0
+        self.mines_flagged = 0
+        # the game is won once this many cells have been explored without stepping on a mine
+        self._win_threshold = GRID_WIDTH*GRID_HEIGHT - MINES_AMOUNT
+        self._current_cell = Position(0,0)
+        # flat, row-major: the button at (row, col) is at index row*GRID_WIDTH + col
+        self.buttons_flat = [MineButton(Position(row,col)) for row in range(GRID_HEIGHT) for col in range(GRID_WIDTH)]
+        self.adj = self.build_adjacency()
+        self.explored_mask = bytearray(GRID_WIDTH*GRID_HEIGHT)
+        # every cell index, reused (and reordered in place) by generate_mines on each new game
+        self._population = list(range(GRID_HEIGHT*GRID_WIDTH))
         self.mines = self.generate_mines(MINES_AMOUNT)
 
     def on_mount(self):
         self.set_current_cell(Position(0,0))
         
+    def build_adjacency(self) -> list[list[int]]:
+        """For each cell's flat index, list the flat indices of the (3 to 8) cells around it that are on the grid.
+           Only depends on the grid size, so it doesn't need rebuilding on reset."""
+        adj = []
+        for row in range(GRID_HEIGHT):
+            for col in range(GRID_WIDTH):
+                adj.append([(row+di)*GRID_WIDTH + col+dj for di, dj in NEIGHBORS
+                            if 0 <= row+di < GRID_HEIGHT and 0 <= col+dj < GRID_WIDTH])
+        return adj
+
     def generate_mines(self,amount: int) ->set:
-        """Generate a random set of unique points on a grid"""
-        return set(
-            Position(int(x/GRID_WIDTH), x%GRID_WIDTH ) for x in random.sample(range(GRID_HEIGHT*GRID_WIDTH), amount))
+        """Generate a random set of unique cells on a grid, stored as row*GRID_WIDTH+col indices,
+           and precompute how many mines neighbour each cell"""
+        # partial Fisher-Yates shuffle of the cached cell list: the first `amount` cells end up a uniform random
+        # sample whatever order the list was left in, without random.sample copying the population every game
+        population = self._population
+        n = len(population)
+        randrange = random.randrange
+        for i in range(amount):
+            j = randrange(i, n)
+            population[i], population[j] = population[j], population[i]
+        mines = set(population[:amount])
+        # each mine adds one to the count of every cell around it, so counting is done once per game, not per cell
+        adj = self.adj
+        counts = [0] * (GRID_WIDTH*GRID_HEIGHT)
+        for mine in mines:
+            for neighbor in adj[mine]:
+                counts[neighbor] += 1
+        self.neighbor_counts = counts
+        return mines
 
     def button_at(self, position: Position) -> MineButton:
-        return self.buttons[position.row][position.col]
+        return self.buttons_flat[position.row*GRID_WIDTH + position.col]
 
     # function to render the widget (name specified by the Textual library)
     def compose(self) -> ComposeResult:
-        grid = Grid(*(button for row in self.buttons for button in row))
+        grid = Grid(*self.buttons_flat)
         grid.styles.grid_size_rows = GRID_HEIGHT
         grid.styles.grid_size_columns = GRID_WIDTH
         grid.styles.width = 3* GRID_WIDTH
@@ -135,37 +214,42 @@ class MineGrid(Static):
                 self.open_cell(event.button)
         elif event.action == SelectAction.FLAG and event.button.explored is False:
                 self.flag_cell(event.button)
-        pass
 
     def open_cell(self, button: MineButton):
-        """Count the number of neighbouring mines. If this is 0, also open all adjacent cells.
+        """Open the chosen cell, cascading to adjacent cells if it has no neighbouring mines.
            If the chosen cell contained a mine, explode and end the game with a loss."""
-        if button.explored:
+        idx = button.index
+        if self.explored_mask[idx]:
             return #don't explore already explored cells
-        button.explored = True
-        self.total_explored += 1
-        pos = button.position
-        if pos in self.mines:
+        if idx in self.mines:
             # stepped on a mine
-            button.label = MineButton.CHAR_MINE
-            button.styles.color = MineButton.NUMBER_COLORS[9]
+            self.explored_mask[idx] = 1
+            button.explored = True
+            self.total_explored += 1
+            button.explode()
             self.post_message(self.GameEnd(win=False))
             return
 
-        mines_nearby = self.count_mines_near(pos)
-        if mines_nearby == 0:
-            button.label = MineButton.CHAR_EMPTY
-            # open all adjacent cells if the mine count is 0 (all adjacent cells are safe)
-            for i in range(max(0,pos.row-1), min(GRID_HEIGHT,pos.row+1+1)):
-                for j in range(max(0,pos.col-1), min(GRID_WIDTH,pos.col+1+1)):
-                    button = self.button_at(Position(i,j))
-                    self.open_cell(button)
-        else:
-            button.set_number(mines_nearby)
-        # win condition is if all explorable cells have been explored without stepping on a mine
-        if self.total_explored >= GRID_HEIGHT * GRID_WIDTH - MINES_AMOUNT:
+        self._cascade(idx)
+        # checked once the whole cascade is done rather than for every cell it opens
+        if self.total_explored >= self._win_threshold:
             self.post_message(self.GameEnd(win=True))
 
+    def _cascade(self, start: int):
+        """Open the cell at flat index start and every cell reachable through cells with no neighbouring mines."""
+        opened = cascade(start, self.adj, self.neighbor_counts, self.explored_mask)
+        # only the label updates are left to do per cell here
+        buttons = self.buttons_flat
+        counts = self.neighbor_counts
+        number_labels = MineButton._NUMBER_LABELS
+        empty_label = MineButton._EMPTY_LABEL
+        for idx in opened:
+            button = buttons[idx]
+            button.explored = True
+            mines_nearby = counts[idx]
+            button.label = number_labels[mines_nearby] if mines_nearby else empty_label
+        self.total_explored += len(opened)
+
     def flag_cell(self, button: MineButton):
         self.mines_flagged += 1 if not button.flagged else -1
         button.toggle_flagged()
@@ -181,14 +265,17 @@ class MineGrid(Static):
         self.reveal_mines(event.win)
 
     def reveal_mines(self, won=False):
-        for mine in self.mines:
-            if won:
-                # show mines as flags if game won without them already being flagged
-                if not self.button_at(mine).flagged:
-                    self.button_at(mine).toggle_flagged()
-            else:
-                # in case of a loss, just explode all mines (most recent one will stay highlighted)
-                self.button_at(mine).explode()
+        # the game is over and the grid disabled, so labels are set directly rather than through the flag/explode
+        # helpers, and all updates are batched into a single repaint
+        with self.app.batch_update():
+            for mine in self.mines:
+                button = self.buttons_flat[mine]
+                if won:
+                    # show mines as flags if game won without them already being flagged
+                    button.label = MineButton._FLAGGED_LABEL
+                else:
+                    # in case of a loss, just explode all mines (most recent one will stay highlighted)
+                    button.label = MineButton._MINE_LABEL
 
 
     def set_current_cell(self, value):
@@ -197,36 +284,23 @@ class MineGrid(Static):
 
         self._current_cell = value
         
-        self.button_at(self._current_cell).can_focus = True
-        self.button_at(self._current_cell).focus()
-
-    def count_mines_near(self,pos: Position):
-        count = 0
-        for i in range(pos.row-1, pos.row+1+1):
-            for j in range(pos.col-1, pos.col+1+1):
-                if Position(i,j) in self.mines:
-                    count +=1
-        return count
+        button = self.button_at(self._current_cell)
+        button.can_focus = True
+        button.focus()
 
 
     def action_move_cell_focus(self, dir):
-        
-        match dir:
-            case "left": 
-                self.set_current_cell(Position(self._current_cell.row, max(0,self._current_cell.col -1)))
-            case "right": 
-                self.set_current_cell(Position(self._current_cell.row, min(GRID_WIDTH-1, self._current_cell.col+1)))
-            case "up": 
-                self.set_current_cell(Position(max(0,self._current_cell.row -1), self._current_cell.col))
-            case "down": 
-                self.set_current_cell(Position(min(GRID_HEIGHT-1, self._current_cell.row+1), self._current_cell.col))
+        dr, dc = _MOVES[dir]
+        row = min(max(0, self._current_cell.row + dr), GRID_HEIGHT-1)
+        col = min(max(0, self._current_cell.col + dc), GRID_WIDTH-1)
+        self.set_current_cell(Position(row, col))
 
     def reset(self):
         self.total_explored = 0
         self.mines_flagged = 0
-        for row in self.buttons:
-            for button in row:
-                button.reset()
+        for button in self.buttons_flat:
+            button.reset()
+        self.explored_mask = bytearray(GRID_WIDTH*GRID_HEIGHT)
         self.set_current_cell(Position(0,0))
         self.mines = self.generate_mines(MINES_AMOUNT)
         self.disabled = False
@@ -235,12 +309,16 @@ class MineGrid(Static):
 class InfoBar(HorizontalGroup):
     """Top bar containing the number of mines remaining, a status indicator, and a timer"""
 
-    timer_value = 0
-    timer_widget = Digits("000")
-    timer_widget.styles.text_align = "right"
+    timer_value = var(0)
+
+    def __init__(self, *children, name = None, id = None, classes = None, disabled = False, markup = True):
+        super().__init__(*children, name=name, id=id, classes=classes, disabled=disabled, markup=markup)
+        self.timer_widget = Digits("000")
+        self.timer_widget.styles.text_align = "right"
+
+        self.restart_button = Button("🙂")
+        self.mine_counter = Digits(f"{MINES_AMOUNT:0>3}")
 
-    restart_button = Button("🙂")
-    mine_counter = Digits(f"{MINES_AMOUNT:0>3}")
     def compose(self) -> ComposeResult:
         yield self.mine_counter
         yield self.restart_button
@@ -251,26 +329,28 @@ class InfoBar(HorizontalGroup):
 
     def update_timer(self):
         self.timer_value += 1
-        self.timer_widget.update(f"{self.timer_value:0>3}")
+
+    def watch_timer_value(self, old: int, new: int):
+        # only called by Textual when the value actually changes
+        self.timer_widget.update(f"{new:03d}")
+
     def on_button_pressed(self, event):
         self.post_message(Reset())
 
     def reset(self):
         self.timer_value = 0
-        self.timer_widget.update("000")
         self.timer_interval.reset()
         self.timer_interval.resume()
         self.restart_button.label= "🙂"
         self.mine_counter.update(f"{MINES_AMOUNT:0>3}")
-    pass
 
 class Reset(Message):
     pass # child class of a message so it's easier to identify it
 
 class TermSweeperApp(App):
-    info_bar = InfoBar()
-    mine_grid = MineGrid()
     def compose(self) -> ComposeResult:
+        self.info_bar = InfoBar()
+        self.mine_grid = MineGrid()
         yield self.info_bar
         yield self.mine_grid
         yield Footer()